@@ -15,12 +15,12 @@ if PY not in sys.path:
 os.makedirs(DUMPS, exist_ok=True)
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-# Detect TVM availability
-try:
-    import tvm  # noqa: F401
-    TVM_AVAILABLE = True
-except Exception:
-    TVM_AVAILABLE = False
+# Detect TVM availability without importing it (the import alone takes seconds)
+import importlib.util
+TVM_AVAILABLE = importlib.util.find_spec("tvm") is not None
+
+# Benchmarks / quantization run in a warm background worker (python/bench_worker.py)
+from bench_worker import call_worker
 
 st.set_page_config(layout="wide", page_title="X-Plain CPU Edition")
 st.title("X-Plain — Explainable Compiler (CPU Edition)")
@@ -63,8 +63,9 @@ with col2:
     precision_mode = st.radio("Precision mode", ["FP32 only", "INT8 only", "FP32 vs INT8 (side-by-side)"], index=2)
     st.markdown("Backends shown depend on whether TVM is installed on this machine.")
 
+    ab_mode = st.checkbox("Interleaved A/B mode (drift-resistant, slower)", value=False,
+                          help="Alternates FP32/INT8 rounds in random order and reports paired speedups with 95% CIs.")
     run_button = st.button("Run Comparison on Selected Model")
-    quantize_script = os.path.join(PY, "quantize_model.py")
 
     if run_button:
         # choose model paths
@@ -75,35 +76,32 @@ with col2:
         if precision_mode in ["INT8 only", "FP32 vs INT8 (side-by-side)"]:
             if not os.path.exists(int8_path):
                 try:
-                    proc_q = subprocess.run([sys.executable, quantize_script, fp32_path, int8_path], capture_output=True, text=True)
-                    st.text(proc_q.stdout)
-                    if proc_q.stderr:
-                        st.text(proc_q.stderr)
+                    if not call_worker("quantize", fp32_model=fp32_path, int8_model=int8_path)["path"]:
+                        raise RuntimeError(f"no INT8 model produced (is {fp32_path} present?)")
+                    st.text(f"Quantized model written to {int8_path}")
                 except Exception as e:
                     st.error(f"Quantization failed: {e}")
                     int8_path = None
 
-        # Determine which args to pass to run_comparison
-        run_comp = os.path.join(PY, "run_comparison.py")
-        args = [sys.executable, run_comp]
-        if precision_mode == "FP32 only":
-            args.append(fp32_path)
-        elif precision_mode == "INT8 only":
-            args.append(fp32_path); args.append(int8_path)
-        else:  # both
-            args.append(fp32_path); args.append(int8_path)
-
-        proc = subprocess.run(args, capture_output=True, text=True)
-        if proc.returncode != 0:
+        # Determine which models to pass to run_comparison (FP32 only: no INT8 model at all)
+        run_args = {"fp32_model": fp32_path, "int8_model": None if precision_mode == "FP32 only" else int8_path}
+
+        host_warnings = []
+        try:
+            if ab_mode:
+                ab = call_worker("run_ab", **run_args)
+                for w in ab.get("host", {}).get("warnings", []):
+                    st.warning(f"Host noise: {w}")
+                if "error" in ab:
+                    raise RuntimeError(ab["error"])
+                res = ab["results"]
+                host_warnings = ab["host"]["warnings"]
+            else:
+                res = call_worker("run_comparison", **run_args)
+        except Exception as e:
             st.error("Benchmarking failed. See output:")
-            st.text(proc.stdout)
-            st.text(proc.stderr)
+            st.text(str(e))
         else:
-            try:
-                res = json.loads(proc.stdout)
-            except Exception:
-                st.text(proc.stdout)
-                res = {}
             if res:
                 st.subheader("Benchmark Results (JSON)")
                 st.json(res)
@@ -116,9 +114,16 @@ with col2:
                     st.bar_chart(df["throughput"])
 
                 # Compiler insights
-                from compiler_insights import explain_results
+                from compiler_insights import explain_results, host_features
                 st.subheader("Compiler Insights")
-                for insight in explain_results(res):
+                try:
+                    adv = call_worker("advisor_inputs", fp32_model=fp32_path)
+                except Exception as e:
+                    st.warning(f"Op profile / fusion analysis unavailable: {e}")
+                    adv = {}
+                host = dict(host_features(intra_op_threads=adv.get("intra_op_threads")), warnings=host_warnings)
+                for insight in explain_results(res, fusion_groups=adv.get("fusion_groups"),
+                                               op_profile=adv.get("op_profile"), host=host):
                     st.markdown(f"- {insight}")
 
 # Model Graph + Relay IR + Diff + Pass Timeline
@@ -126,12 +131,12 @@ st.markdown("---")
 st.header("Model Graph & Compiler IR")
 
 from graph_visualizer import dump_graph_json, simulate_pass_fusion_graph
-from dump_relay import dump_relay_ir, dump_relay_timeline
 from ir_diff import diff_ir
+from memory_planner import plan_memory, measure_rss, compare_with_measured
 
 import pandas as pd
 
-tab1, tab2, tab3 = st.tabs(["ONNX Graph", "Fusion Graph", "Relay IR"])
+tab1, tab2, tab3, tab4 = st.tabs(["ONNX Graph", "Fusion Graph", "Relay IR", "Memory"])
 
 with tab1:
     st.subheader("ONNX Graph (Full Model)")
@@ -275,6 +280,7 @@ with tab2:
 with tab3:
     st.subheader("TVM Relay IR (Before/After)")
     if st.button("Dump Relay IR (raw & optimized)"):
+        from dump_relay import dump_relay_timeline  # imports TVM, so only on demand
         paths = dump_relay_timeline(model_path)
         st.success("Relay IR dumps created.")
         for p in paths:
@@ -285,6 +291,7 @@ with tab3:
                 st.code(content[:2000] + ("\n...truncated" if len(content) > 2000 else ""), language="text")
 
     if st.button("Compare Relay IR (diff)"):
+        from dump_relay import dump_relay_ir
         raw = dump_relay_ir(model_path, optimized=False, opt_level=0)
         opt = dump_relay_ir(model_path, optimized=True, opt_level=3)
         if raw and opt and os.path.exists(raw) and os.path.exists(opt):
@@ -300,3 +307,36 @@ with tab3:
                 st.info("No differences detected.")
         else:
             st.warning("Relay dumps not available (TVM missing?)")
+
+@st.cache_data(show_spinner="Planning activation memory...")
+def cached_plan(path, mtime):
+    # mtime is only part of the cache key, so re-uploads replan
+    return plan_memory(path)
+
+with tab4:
+    st.subheader("Activation Memory Plan")
+    plan = None
+    if not os.path.exists(model_path):
+        st.error(f"Model not found at {model_path}. Export or upload a model first.")
+    else:
+        try:
+            plan = cached_plan(model_path, os.path.getmtime(model_path))
+        except Exception as e:
+            st.error(f"Memory planning failed: {e}")
+
+    if plan is not None:
+        est = plan["estimates"]
+        st.info(f"Planned peak: {plan['peak_mb']:.2f} MB of live activations at step {plan['peak_step']} "
+                f"({plan['peak_node']}), {plan['num_activation_tensors']} tensors.")
+        st.write(f"In-place reuse could save ~{est['inplace_saving_pct']:.1f}%, fusion ~{est['fusion_saving_pct']:.1f}%, "
+                 f"both ~{est['combined_saving_pct']:.1f}%.")
+        if plan["unknown_shape_tensors"]:
+            st.warning(f"{plan['unknown_shape_tensors']} tensors have unknown shapes and are counted as 0 bytes.")
+
+        st.write("### Live Activation Bytes per Step")
+        st.line_chart(pd.Series(plan["timeline"], name="live bytes"))
+        st.write("### Tensors Live at Peak")
+        st.dataframe(pd.DataFrame(plan["live_at_peak"]))
+
+        if st.button("Measure RSS (ORT / TVM)"):
+            st.json(compare_with_measured(plan, measure_rss(model_path)))
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Interleaved, drift-resistant A/B benchmarking.
+
+run_all() measures every FP32 configuration and then every INT8 one, so thermal
+throttling, turbo decay or background load bias whichever runs later. Here all
+configurations are prepared once and then measured in short rounds, in a fresh
+random order every round. FP32/INT8 pairs of the same backend are compared round
+by round (paired speedup), with a bootstrap 95% confidence interval.
+
+The host is sampled before and after (governor, frequencies, load, throttle
+counters from /proc and /sys) and the run is flagged or refused when noisy.
+"""
+import os, sys, glob, json, time, random
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
+MODEL_INT8_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2_int8.onnx")
+
+# Busy fraction per CPU from other processes above which results are unreliable / refused
+LOAD_WARN = 0.3
+LOAD_REFUSE = 0.8
+# Window (s) over which /proc/stat busy time is sampled
+BUSY_SAMPLE_S = 0.5
+# Relative change of the mean current frequency between before/after that is flagged
+FREQ_DRIFT_WARN = 0.10
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _read_int(path):
+    v = _read(path)
+    try:
+        return int(v) if v is not None else None
+    except ValueError:
+        return None
+
+def _proc_stat_busy():
+    # Busy (non-idle, non-iowait) seconds summed over all CPUs since boot
+    line = _read("/proc/stat")
+    if not line or not line.startswith("cpu "):
+        return None
+    ticks = [int(x) for x in line.splitlines()[0].split()[1:]]
+    return (sum(ticks[:8]) - ticks[3] - ticks[4]) / os.sysconf("SC_CLK_TCK")
+
+def other_busy_per_cpu(window=BUSY_SAMPLE_S):
+    """
+    CPU busy fraction caused by other processes, sampled over `window` seconds.
+    This process's own CPU time (e.g. runtime threads still spinning after the
+    previous request) is subtracted, unlike in the load average, which also lags
+    recent work by about a minute.
+    """
+    b0, own0 = _proc_stat_busy(), sum(os.times()[:2])
+    if b0 is None:
+        return None
+    time.sleep(window)
+    b1, own1 = _proc_stat_busy(), sum(os.times()[:2])
+    others = max(0.0, (b1 - b0) - (own1 - own0))
+    return others / window / (os.cpu_count() or 1)
+
+def host_state(busy_window=BUSY_SAMPLE_S):
+    """
+    Snapshot of CPU state from /proc and /sys. Every field is best effort and is
+    None where the kernel / VM does not expose it.
+    """
+    cpus = sorted(glob.glob("/sys/devices/system/cpu/cpu[0-9]*"),
+                  key=lambda p: int(p.rsplit("cpu", 1)[1]))
+    governors, freqs, max_freqs = set(), [], []
+    core_throttle = pkg_throttle = None
+    for c in cpus:
+        gov = _read(os.path.join(c, "cpufreq", "scaling_governor"))
+        if gov:
+            governors.add(gov)
+        f = _read_int(os.path.join(c, "cpufreq", "scaling_cur_freq"))
+        if f is not None:
+            freqs.append(f)
+        m = _read_int(os.path.join(c, "cpufreq", "scaling_max_freq"))
+        if m is not None:
+            max_freqs.append(m)
+        ct = _read_int(os.path.join(c, "thermal_throttle", "core_throttle_count"))
+        if ct is not None:
+            core_throttle = (core_throttle or 0) + ct
+        pt = _read_int(os.path.join(c, "thermal_throttle", "package_throttle_count"))
+        if pt is not None:
+            pkg_throttle = max(pkg_throttle or 0, pt)
+
+    load = _read("/proc/loadavg")
+    loadavg = [float(x) for x in load.split()[:3]] if load else None
+    ncpu = os.cpu_count() or 1
+    return {
+        "time": time.time(),
+        "cpus": ncpu,
+        "governors": sorted(governors) or None,
+        "cur_freq_khz_mean": float(np.mean(freqs)) if freqs else None,
+        "cur_freq_khz_min": min(freqs) if freqs else None,
+        "max_freq_khz": max(max_freqs) if max_freqs else None,
+        "loadavg": loadavg,
+        "load_per_cpu": loadavg[0] / ncpu if loadavg else None,
+        "busy_per_cpu": other_busy_per_cpu(busy_window),
+        "core_throttle_count": core_throttle,
+        "package_throttle_count": pkg_throttle,
+        "no_turbo": _read_int("/sys/devices/system/cpu/intel_pstate/no_turbo"),
+    }
+
+def noise_check(before, after=None):
+    """
+    Returns (warnings, refuse). `refuse` is only set by conditions that make the
+    comparison meaningless; everything else is a warning.
+    """
+    warnings, refuse = [], False
+    busy = before.get("busy_per_cpu")
+    if busy is not None:
+        if busy > LOAD_REFUSE:
+            warnings.append(f"other processes keep {busy * 100:.0f}% of {before['cpus']} CPUs busy")
+            refuse = True
+        elif busy > LOAD_WARN:
+            warnings.append(f"other processes use {busy * 100:.0f}% of {before['cpus']} CPUs and may add noise")
+    else:
+        # No /proc/stat: fall back to the load average, which includes our own recent work
+        lpc = before.get("load_per_cpu")
+        if lpc is not None and lpc > LOAD_REFUSE:
+            warnings.append(f"load average {before['loadavg'][0]:.2f} on {before['cpus']} CPUs is too high")
+            refuse = True
+        elif lpc is not None and lpc > LOAD_WARN:
+            warnings.append(f"background load {before['loadavg'][0]:.2f} on {before['cpus']} CPUs may add noise")
+    govs = before.get("governors") or []
+    if govs and govs != ["performance"]:
+        warnings.append(f"CPU governor is {', '.join(govs)} (not 'performance'); frequency may ramp during the run")
+    if after is not None:
+        for key in ("core_throttle_count", "package_throttle_count"):
+            a, b = before.get(key), after.get(key)
+            if a is not None and b is not None and b > a:
+                warnings.append(f"thermal throttling during the run ({key} +{b - a})")
+        fa, fb = before.get("cur_freq_khz_mean"), after.get("cur_freq_khz_mean")
+        if fa and fb and abs(fb - fa) / fa > FREQ_DRIFT_WARN:
+            warnings.append(f"mean CPU frequency drifted {fa / 1000:.0f} -> {fb / 1000:.0f} MHz")
+        ba = after.get("busy_per_cpu")
+        if ba is not None and ba > LOAD_REFUSE:
+            warnings.append(f"other processes kept {ba * 100:.0f}% of the CPUs busy right after the run")
+    return warnings, refuse
+
+def _ort_runner(model_path, input_shape, cache=None):
+    from benchmark_onnx import create_session
+    sess = cache.ort_session(model_path) if cache is not None else create_session(model_path)
+    feeds = {sess.get_inputs()[0].name: np.random.randn(*input_shape).astype(np.float32)}
+    return lambda: sess.run(None, feeds)
+
+def _tvm_runner(backend, model_path, input_shape, cache=None):
+    if backend.tvm is None:
+        raise RuntimeError("TVM not installed")
+    from tvm.contrib import graph_executor
+    if cache is not None:
+        lib, input_name = cache.tvm_module(model_path, backend, input_shape)
+    else:
+        lib, input_name = backend.compile_tvm(model_path, input_shape)
+    m = graph_executor.GraphModule(lib["default"](backend.tvm.cpu()))
+    m.set_input(input_name, backend.tvm.nd.array(np.random.randn(*input_shape).astype("float32")))
+    return m.run
+
+def build_runners(fp32_model=MODEL_DEFAULT, int8_model=MODEL_INT8_DEFAULT, input_shape=(1,3,224,224),
+                  cache=None):
+    """
+    Returns ({config_name: callable}, {config_name: error}) using the run_all names.
+    `cache` (bench_worker.SessionCache) supplies warm sessions / built TVM modules.
+    """
+    builders = [("ONNXRuntime", lambda p: _ort_runner(p, input_shape, cache))]
+    try:
+        import benchmark_tvm, benchmark_tvm_ryzen
+        if benchmark_tvm.tvm is not None:
+            builders.append(("TVM-CortexA75", lambda p: _tvm_runner(benchmark_tvm, p, input_shape, cache)))
+            builders.append(("TVM-Ryzen", lambda p: _tvm_runner(benchmark_tvm_ryzen, p, input_shape, cache)))
+    except Exception:
+        pass
+
+    models = [("FP32", fp32_model)]
+    if int8_model and os.path.exists(int8_model):
+        models.append(("INT8", int8_model))
+
+    runners, errors = {}, {}
+    for prec, path in models:
+        for backend, build in builders:
+            name = f"{prec}-{backend}"
+            try:
+                run = build(path)
+                run()  # fail here, not halfway through the rounds
+                runners[name] = run
+            except Exception as e:
+                errors[name] = str(e)
+    return runners, errors
+
+def interleaved_rounds(runners, rounds=20, iters=10, warmup=5, seed=0):
+    """
+    Every round runs each configuration `iters` times, in a new random order.
+    Returns {name: [per-round median seconds]}.
+    """
+    rng = random.Random(seed)
+    names = list(runners)
+    for n in names:
+        for _ in range(warmup):
+            runners[n]()
+    per_round = {n: [] for n in names}
+    for _ in range(rounds):
+        rng.shuffle(names)
+        for n in names:
+            run = runners[n]
+            times = []
+            for _ in range(iters):
+                t0 = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - t0)
+            per_round[n].append(float(np.median(times)))
+    return per_round
+
+def paired_speedup(base_rounds, new_rounds, n_boot=2000, seed=0):
+    """
+    Geometric-mean speedup base/new over paired rounds with a bootstrap 95% CI.
+    """
+    logs = np.log(np.asarray(base_rounds) / np.asarray(new_rounds))
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(logs), size=(n_boot, len(logs)))
+    boot = logs[idx].mean(axis=1)
+    lo, hi = np.percentile(boot, [2.5, 97.5])
+    return {"speedup": float(np.exp(logs.mean())),
+            "ci95": [float(np.exp(lo)), float(np.exp(hi))],
+            "rounds": int(len(logs))}
+
+def run_ab(fp32_model=MODEL_DEFAULT, int8_model=MODEL_INT8_DEFAULT, rounds=20, iters=10,
+           seed=0, refuse_noisy=True, cache=None):
+    """
+    Interleaved A/B run. Returns {"results", "speedups", "host"}; "results" uses the
+    run_all keys and fields, INT8 entries additionally carry the paired speedup
+    over their FP32 twin. With refuse_noisy, a too-busy host returns {"error", "host"}.
+    """
+    before = host_state()
+    warnings, refuse = noise_check(before)
+    if refuse and refuse_noisy:
+        return {"error": "host too noisy for A/B benchmarking: " + "; ".join(warnings),
+                "host": {"before": before, "warnings": warnings}}
+
+    runners, errors = build_runners(fp32_model, int8_model, cache=cache)
+    per_round = interleaved_rounds(runners, rounds, iters, seed=seed)
+    after = host_state()
+    warnings, _ = noise_check(before, after)
+    for w in warnings:
+        print(f"[ab_benchmark] WARNING: {w}")
+
+    results = {name: {"error": e} for name, e in errors.items()}
+    for name, r in per_round.items():
+        med = float(np.median(r))
+        results[name] = {"latency_ms": med * 1000.0, "throughput": 1.0 / med}
+    speedups = {}
+    for name in per_round:
+        if name.startswith("INT8-") and "FP32-" + name[5:] in per_round:
+            sp = paired_speedup(per_round["FP32-" + name[5:]], per_round[name], seed=seed)
+            speedups[name[5:]] = sp
+            results[name].update(speedup_vs_fp32=sp["speedup"], speedup_ci95=sp["ci95"])
+
+    return {"results": results, "speedups": speedups,
+            "round_latency_ms": {n: [x * 1000.0 for x in r] for n, r in per_round.items()},
+            "host": {"before": before, "after": after, "warnings": warnings},
+            "rounds": rounds, "iters_per_round": iters, "seed": seed}
+
+if __name__ == "__main__":
+    fp32 = sys.argv[1] if len(sys.argv) > 1 else MODEL_DEFAULT
+    int8 = sys.argv[2] if len(sys.argv) > 2 else MODEL_INT8_DEFAULT
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    print(json.dumps(run_ab(fp32, int8, rounds), indent=2))
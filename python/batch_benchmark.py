@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Headless model-zoo batch mode.
+
+    python batch_benchmark.py <models_dir | manifest.txt | manifest.json> [--out DIR] [--workers N]
+
+For every model: INT8 quantization, the backend comparison (run_comparison.run_all,
+fed random inputs shaped like the model's own inputs) and graph op counts. Quantization and graph stats run in a bounded process pool;
+benchmarks run one model at a time so timings do not compete for cores. Artifacts
+are cached under <out>/cache/<hash of model + input shapes + bench_config()>/ so reruns
+only do new work.
+Writes <out>/report.csv (+ report.parquet when pandas/pyarrow are installed) and
+<out>/report.html. A failing model is recorded in the report and the batch continues.
+"""
+import os, sys, csv, json, html, time, hashlib, argparse, traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OUT_DEFAULT = os.path.join(ROOT, "dumps", "batch")
+
+# Outputs of quantize_model / quantize_search, not candidates of their own
+SKIP_SUFFIXES = ("_int8.onnx", "_mixed.onnx")
+
+def discover_models(source):
+    """
+    Directory -> every *.onnx below it (quantized twins skipped).
+    .json manifest -> list of paths; any other file -> one path per line (# comments allowed).
+    Relative manifest entries resolve against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        found = []
+        for d, _, files in os.walk(source):
+            for f in files:
+                if f.endswith(".onnx") and not f.endswith(SKIP_SUFFIXES):
+                    found.append(os.path.join(d, f))
+        return sorted(found)
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        if source.endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [ln.strip() for ln in f if ln.strip() and not ln.strip().startswith("#")]
+    return [e if os.path.isabs(e) else os.path.join(base, e) for e in entries]
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def bench_config():
+    """
+    Everything besides the model bytes that changes a result. Part of the cache key,
+    so installing TVM or upgrading onnxruntime invalidates old results.
+    """
+    import importlib.util
+    from importlib import metadata
+    try:
+        ort_version = metadata.version("onnxruntime")
+    except metadata.PackageNotFoundError:
+        ort_version = None
+    return {
+        "iters": 30,
+        "warmup": 5,
+        "quantization": "static/QOperator/QInt8/per-channel/random-calibration",
+        "onnxruntime": ort_version,
+        "tvm": importlib.util.find_spec("tvm") is not None,
+    }
+
+def model_input_shapes(model_path):
+    """{input_name: shape} the model is benchmarked with (symbolic dims -> 1)."""
+    from quantize_model import input_shapes
+    return {n: list(s) for n, s in input_shapes(model_path).items()}
+
+def cache_key(model_path, config, shapes):
+    h = hashlib.sha1(_file_hash(model_path).encode())
+    h.update(json.dumps(shapes, sort_keys=True).encode())
+    h.update(json.dumps(config, sort_keys=True).encode())
+    return h.hexdigest()
+
+def prepare_model(model_path, cache_dir):
+    """
+    Parallel phase: INT8 quantization and graph stats. Never raises; failures are
+    returned in the record.
+    """
+    record = {"model": model_path, "status": "ok", "cached": False}
+    t0 = time.perf_counter()
+    try:
+        from quantize_model import quantize_model
+        from graph_visualizer import canonicalize
+        import onnx
+
+        os.makedirs(cache_dir, exist_ok=True)
+        int8_path = os.path.join(cache_dir, "model_int8.onnx")
+        if not os.path.exists(int8_path):
+            try:
+                quantize_model(model_path, int8_path)
+            except Exception as e:
+                # Still benchmark FP32 when quantization is not possible
+                record["quantize_error"] = str(e)
+                if os.path.exists(int8_path):
+                    os.remove(int8_path)
+        record["int8_model"] = int8_path
+
+        # Op counts over real operators only (dump_graph_json also counts tensor nodes)
+        model = onnx.load(model_path, load_external_data=False)
+        counts = {}
+        for node in model.graph.node:
+            cat = canonicalize(node.op_type)
+            counts[cat] = counts.get(cat, 0) + 1
+        record["graph"] = {"nodes": len(model.graph.node),
+                           "initializers": len(model.graph.initializer), "counts": counts}
+    except Exception as e:
+        record.update(status="failed", error=str(e), traceback=traceback.format_exc())
+    record["seconds"] = time.perf_counter() - t0
+    return record
+
+def benchmark_model(model_path, int8_path, shapes):
+    """Serial phase: run_all, one model at a time so timings do not compete for cores."""
+    from run_comparison import run_all
+    return run_all(model_path, int8_path, input_shapes=shapes)
+
+def _map_isolated(fn, jobs, workers):
+    """
+    Runs fn(*args) for each {key: args} in a spawn pool and returns {key: result or
+    exception}. A native crash breaks the whole pool and fails every pending future,
+    so jobs left unfinished are rerun one per fresh single-worker pool; that way a
+    crash is charged only to the job that caused it.
+    """
+    ctx = mp.get_context("spawn")  # never fork a process that may hold ORT / TVM thread pools
+    out = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx) as pool:
+        futures = {pool.submit(fn, *args): key for key, args in jobs.items()}
+        for fut in as_completed(futures):
+            try:
+                out[futures[fut]] = fut.result()
+            except BrokenProcessPool:
+                pass
+            except Exception as e:
+                out[futures[fut]] = e
+    for key, args in jobs.items():
+        if key in out:
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                out[key] = pool.submit(fn, *args).result()
+            except BrokenProcessPool as e:
+                out[key] = RuntimeError(f"worker crashed: {e!r}")
+            except Exception as e:
+                out[key] = e
+    return out
+
+def _failed(model, err):
+    return {"model": model, "status": "failed", "cached": False, "error": str(err)}
+
+def run_batch(models, out_dir=OUT_DEFAULT, workers=2):
+    cache_root = os.path.join(out_dir, "cache")
+    os.makedirs(cache_root, exist_ok=True)
+    config = bench_config()
+    models = list(dict.fromkeys(models))
+
+    records, todo, shapes = {}, {}, {}
+    for m in models:
+        try:
+            shapes[m] = model_input_shapes(m)
+            cache_dir = os.path.join(cache_root, cache_key(m, config, shapes[m]))
+        except Exception as e:
+            records[m] = _failed(m, e)
+            continue
+        result_file = os.path.join(cache_dir, "result.json")
+        if os.path.exists(result_file):
+            with open(result_file, "r", encoding="utf-8") as f:
+                records[m] = dict(json.load(f), model=m, cached=True)
+        else:
+            todo[m] = cache_dir
+
+    # Quantization + graph stats in parallel
+    prepared = _map_isolated(prepare_model, {m: (m, d) for m, d in todo.items()}, workers)
+    to_bench = {}
+    for m, rec in prepared.items():
+        if isinstance(rec, Exception):
+            records[m] = _failed(m, rec)
+        elif rec["status"] != "ok":
+            records[m] = rec
+        else:
+            records[m] = rec
+            rec["input_shapes"] = shapes[m]
+            to_bench[m] = (m, rec["int8_model"] if os.path.exists(rec["int8_model"]) else None, shapes[m])
+
+    # Timing strictly one model at a time, still in a child so a crash stays isolated
+    benched = _map_isolated(benchmark_model, to_bench, workers=1)
+    for m, res in benched.items():
+        rec = records[m]
+        rec.pop("int8_model", None)
+        if isinstance(res, Exception):
+            records[m] = dict(rec, status="failed", error=str(res))
+            continue
+        rec["results"] = res
+        # run_all reports per-backend errors instead of raising
+        fp32 = res.get("FP32-ONNXRuntime", {})
+        if "error" in fp32:
+            rec.update(status="failed", error=fp32["error"])
+            continue
+        # Only complete runs are cached; failures are retried next time
+        with open(os.path.join(todo[m], "result.json"), "w", encoding="utf-8") as f:
+            json.dump(rec, f, indent=2)
+
+    for m in models:
+        rec = records[m]
+        print(f"[batch_benchmark] {rec['status']:6s} {'(cached) ' if rec.get('cached') else ''}{m}")
+    return [records[m] for m in sorted(models)]
+
+def flatten(record):
+    row = {
+        "model": record["model"],
+        "status": record["status"],
+        "cached": record.get("cached", False),
+        "seconds": round(record.get("seconds", 0.0), 3),
+        "error": record.get("error") or record.get("quantize_error", ""),
+        "inputs": " ".join(f"{n}:{'x'.join(map(str, s))}" for n, s in record.get("input_shapes", {}).items()),
+    }
+    for backend, res in sorted(record.get("results", {}).items()):
+        if "error" in res:
+            row[f"{backend}.error"] = res["error"]
+            continue
+        for metric in ("latency_ms", "throughput", "memory_mb", "energy_est"):
+            if metric in res:
+                row[f"{backend}.{metric}"] = res[metric]
+    graph = record.get("graph")
+    if graph:
+        row["graph.nodes"] = graph["nodes"]
+        row["graph.initializers"] = graph["initializers"]
+        for op, n in sorted(graph["counts"].items()):
+            row[f"ops.{op}"] = n
+    return row
+
+def _columns(rows):
+    cols = []
+    for r in rows:
+        for k in r:
+            if k not in cols:
+                cols.append(k)
+    return cols
+
+def write_reports(records, out_dir=OUT_DEFAULT):
+    rows = [flatten(r) for r in records]
+    cols = _columns(rows)
+    paths = {}
+
+    paths["csv"] = os.path.join(out_dir, "report.csv")
+    with open(paths["csv"], "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=cols)
+        w.writeheader()
+        w.writerows(rows)
+
+    try:
+        import pandas as pd
+        paths["parquet"] = os.path.join(out_dir, "report.parquet")
+        pd.DataFrame(rows, columns=cols).to_parquet(paths["parquet"], index=False)
+    except Exception as e:
+        paths.pop("parquet", None)
+        print(f"[batch_benchmark] Parquet report skipped ({e})")
+
+    paths["html"] = os.path.join(out_dir, "report.html")
+    with open(paths["html"], "w", encoding="utf-8") as f:
+        f.write(render_html(rows, cols))
+    return paths
+
+def render_html(rows, cols):
+    failed = sum(1 for r in rows if r["status"] != "ok")
+    cached = sum(1 for r in rows if r["cached"])
+
+    def cell(v):
+        if isinstance(v, float):
+            v = f"{v:.3f}"
+        return f"<td>{html.escape(str(v))}</td>"
+
+    body = []
+    for r in rows:
+        cls = ' class="failed"' if r["status"] != "ok" else ""
+        body.append(f"<tr{cls}>" + "".join(cell(r.get(c, "")) for c in cols) + "</tr>")
+    head = "".join(f"<th>{html.escape(c)}</th>" for c in cols)
+    return f"""<html><head><meta charset="utf-8"><title>X-Plain batch report</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; font-size: 12px; }}
+td, th {{ border: 1px solid #ccc; padding: 2px 6px; }}
+tr.failed {{ background: #fadbd8; }}
+</style></head><body>
+<h1>X-Plain batch report</h1>
+<p>{len(rows)} models, {failed} failed, {cached} served from cache.</p>
+<table><tr>{head}</tr>
+{chr(10).join(body)}
+</table></body></html>
+"""
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark a directory or manifest of ONNX models.")
+    ap.add_argument("source", help="directory of .onnx files, or a manifest (.txt / .json)")
+    ap.add_argument("--out", default=OUT_DEFAULT, help="output directory for cache and reports")
+    ap.add_argument("--workers", type=int, default=2,
+                    help="parallel processes for quantization / graph stats (benchmarks are serial)")
+    a = ap.parse_args()
+
+    models = discover_models(a.source)
+    if not models:
+        print(f"[batch_benchmark] No ONNX models found in {a.source}")
+        sys.exit(1)
+    print(f"[batch_benchmark] {len(models)} models, {a.workers} workers -> {a.out}")
+    recs = run_batch(models, a.out, a.workers)
+    for kind, p in write_reports(recs, a.out).items():
+        print(f"[batch_benchmark] Wrote {kind} report to {p}")
+    sys.exit(1 if any(r["status"] != "ok" for r in recs) else 0)
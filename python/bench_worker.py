@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Long-lived benchmark worker.
+
+The app used to spawn a fresh `run_comparison.py` / `quantize_model.py` process per
+click, paying for numpy / onnx / onnxruntime / TVM imports and session creation every
+time. This worker imports them once, keeps an LRU of live ORT sessions and built TVM
+modules, and answers requests over a local authenticated socket
+(multiprocessing.connection), returning plain Python dicts.
+
+    python bench_worker.py            # serve (normally started by `call_worker`)
+    python bench_worker.py --stop     # ask a running worker to exit
+
+Each checkout gets its own worker: a Unix socket under dumps/ (or, where that is not
+possible, a localhost port derived from the checkout path). A worker started from
+older code than the caller's is replaced on the next request.
+"""
+import os, sys, glob, time, socket, hashlib, secrets, subprocess, traceback
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DUMPS = os.path.join(ROOT, "dumps")
+KEY_FILE = os.path.join(DUMPS, ".bench_worker.key")
+LOG_FILE = os.path.join(DUMPS, "bench_worker.log")
+SOCKET_FILE = os.path.join(DUMPS, "bench_worker.sock")
+CACHE_SIZE = 8
+
+def _default_address():
+    if os.environ.get("XPLAIN_WORKER_PORT"):
+        return ("127.0.0.1", int(os.environ["XPLAIN_WORKER_PORT"]))
+    # sun_path is limited to ~108 bytes
+    if hasattr(socket, "AF_UNIX") and len(SOCKET_FILE.encode()) < 100:
+        return SOCKET_FILE
+    return ("127.0.0.1", 40000 + int(hashlib.sha1(ROOT.encode()).hexdigest(), 16) % 20000)
+
+ADDRESS = _default_address()
+
+def _code_version():
+    # Content hash of the Python sources the worker imports
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+CODE_VERSION = _code_version()
+
+def _authkey():
+    # Per-checkout secret so only local processes that can read dumps/ may talk to the worker
+    os.makedirs(DUMPS, exist_ok=True)
+    if not os.path.exists(KEY_FILE):
+        fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(KEY_FILE, "r", encoding="utf-8") as f:
+        return f.read().strip().encode()
+
+def model_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class SessionCache:
+    """
+    LRU of live runtime objects keyed by (model content hash, config).
+    Keying on content rather than path means an overwritten `uploaded.onnx`
+    never reuses a stale session.
+    """
+    def __init__(self, capacity=CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, build):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = build()
+        self.entries[key] = value
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return value
+
+    def ort_session(self, model_path):
+        from benchmark_onnx import create_session
+        key = ("ort", model_hash(model_path), "CPUExecutionProvider")
+        return self._get(key, lambda: create_session(model_path))
+
+    def tvm_module(self, model_path, backend, input_shape=(1,3,224,224), input_shapes=None):
+        # `backend` is a benchmark_tvm* module exposing TARGET and compile_tvm()
+        shapes = tuple(sorted((n, tuple(s)) for n, s in input_shapes.items())) if input_shapes else tuple(input_shape)
+        # A new tuning log means a different build
+        log = backend.tuning_log()
+        key = ("tvm", model_hash(model_path), backend.TARGET, shapes, log and os.path.getmtime(log))
+        return self._get(key, lambda: backend.compile_tvm(model_path, input_shape, input_shapes))
+
+    def advisor_inputs(self, model_path):
+        # Profile + ORT-optimized graph are per model and cost a session build each, so keep them
+        from compiler_insights import profile_ops, fusion_groups
+        from benchmark_onnx import effective_intra_op_threads
+        key = ("advisor", model_hash(model_path))
+        return self._get(key, lambda: {"op_profile": profile_ops(model_path),
+                                       "fusion_groups": fusion_groups(model_path),
+                                       "intra_op_threads": effective_intra_op_threads()})
+
+    def stats(self):
+        return {"size": len(self.entries), "capacity": self.capacity,
+                "hits": self.hits, "misses": self.misses}
+
+def _handle(cache, cmd, args):
+    if cmd == "ping":
+        return {"pid": os.getpid(), "version": CODE_VERSION, "cache": cache.stats()}
+    if cmd == "run_comparison":
+        from run_comparison import run_all
+        return run_all(args["fp32_model"], args.get("int8_model"), cache=cache,
+                       input_shapes=args.get("input_shapes"))
+    if cmd == "run_ab":
+        from ab_benchmark import run_ab
+        return run_ab(args["fp32_model"], args.get("int8_model"), args.get("rounds", 20), cache=cache)
+    if cmd == "advisor_inputs":
+        # Runtime-side inputs for compiler_insights.explain_results
+        return cache.advisor_inputs(args["fp32_model"])
+    if cmd == "quantize":
+        from quantize_model import quantize_model
+        return {"path": quantize_model(args["fp32_model"], args["int8_model"])}
+    if cmd == "quantize_search":
+        from quantize_search import search_quantization
+        return search_quantization(args["fp32_model"], args.get("output_path"),
+                                   args.get("error_budget", 0.02))
+    raise ValueError(f"unknown command {cmd!r}")
+
+def serve(address=ADDRESS):
+    # Warm the heavy imports up front so the first request is already fast
+    import numpy, onnx, onnxruntime  # noqa: F401
+    try:
+        import tvm  # noqa: F401
+    except Exception:
+        pass
+    import run_comparison  # noqa: F401
+
+    cache = SessionCache()
+    with Listener(address, authkey=_authkey()) as listener:
+        print(f"[bench_worker] Listening on {_describe(address)} (pid {os.getpid()}, code {CODE_VERSION})",
+              flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"[bench_worker] Rejected connection: {e}", flush=True)
+                continue
+            with conn:
+                try:
+                    req = conn.recv()
+                except EOFError:
+                    continue
+                cmd = req.get("cmd")
+                if cmd == "shutdown":
+                    conn.send({"ok": True, "result": None})
+                    print("[bench_worker] Shutting down", flush=True)
+                    return
+                t0 = time.perf_counter()
+                try:
+                    resp = {"ok": True, "result": _handle(cache, cmd, req.get("args", {}))}
+                except Exception as e:
+                    resp = {"ok": False, "error": str(e), "traceback": traceback.format_exc()}
+                print(f"[bench_worker] {cmd} done in {time.perf_counter() - t0:.2f}s", flush=True)
+                conn.send(resp)
+
+def _describe(address):
+    return address if isinstance(address, str) else f"{address[0]}:{address[1]}"
+
+def _connect(address=ADDRESS):
+    try:
+        return Client(address, authkey=_authkey())
+    except AuthenticationError as e:
+        raise RuntimeError(f"{_describe(address)} is served by a process with a different key (another "
+                           f"checkout's bench_worker?); stop it or set XPLAIN_WORKER_PORT") from e
+
+def _ping(address):
+    with _connect(address) as conn:
+        conn.send({"cmd": "ping"})
+        resp = conn.recv()
+    return resp.get("result") or {}
+
+def _wait_gone(address, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _connect(address).close()
+        except (ConnectionRefusedError, OSError):
+            return
+        time.sleep(0.1)
+
+def start_worker(timeout=60.0, address=ADDRESS):
+    """
+    Spawns a detached worker unless an up-to-date one answers, and waits until it
+    accepts connections. A worker running other code than ours is stopped first.
+    """
+    try:
+        if _ping(address).get("version") == CODE_VERSION:
+            return
+        print(f"[bench_worker] Restarting worker on {_describe(address)}: code changed")
+        stop_worker(address)
+        _wait_gone(address)
+    except (ConnectionRefusedError, OSError, EOFError):
+        pass
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # socket file left behind by a worker that died
+    os.makedirs(DUMPS, exist_ok=True)
+    log = open(LOG_FILE, "a", encoding="utf-8")
+    subprocess.Popen([sys.executable, os.path.abspath(__file__)], cwd=os.path.dirname(os.path.abspath(__file__)),
+                     stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _connect(address).close()
+            return
+        except (ConnectionRefusedError, OSError):
+            time.sleep(0.1)
+    raise RuntimeError(f"bench_worker did not start on {_describe(address)} within {timeout:.0f}s, "
+                       f"see {LOG_FILE}")
+
+def call_worker(cmd, address=ADDRESS, **args):
+    """
+    Sends one request to the worker (starting it if needed) and returns its result.
+    Raises RuntimeError carrying the worker-side error message on failure.
+    """
+    start_worker(address=address)
+    with _connect(address) as conn:
+        conn.send({"cmd": cmd, "args": args})
+        resp = conn.recv()
+    if not resp["ok"]:
+        raise RuntimeError(f"{resp['error']}\n{resp.get('traceback', '')}")
+    return resp["result"]
+
+def stop_worker(address=ADDRESS):
+    try:
+        with _connect(address) as conn:
+            conn.send({"cmd": "shutdown"})
+            conn.recv()
+        return True
+    except (ConnectionRefusedError, OSError, EOFError):
+        return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--stop":
+        print("[bench_worker] stopped" if stop_worker() else "[bench_worker] not running")
+    else:
+        serve()
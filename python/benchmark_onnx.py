@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, time, numpy as np, psutil
+import os, json, time, shutil, tempfile, numpy as np, psutil
 try:
     import onnxruntime as ort
 except Exception as e:
@@ -8,15 +8,65 @@ except Exception as e:
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
 
-def benchmark_onnx(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5):
+# intra-op threads for benchmark sessions; 0 = ORT default (one per physical core)
+INTRA_OP_THREADS = int(os.environ.get("XPLAIN_ORT_THREADS", "0"))
+
+def effective_intra_op_threads():
+    return INTRA_OP_THREADS or psutil.cpu_count(logical=False) or os.cpu_count()
+
+def create_session(model_path):
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = INTRA_OP_THREADS
+    return ort.InferenceSession(model_path, so, providers=["CPUExecutionProvider"])
+
+def profile_node_times(model_path, iters=10):
+    """
+    Runs `iters` profiled inferences on random inputs and returns {node_name: mean_kernel_us}.
+    Basic optimization level only: layout / fusion passes rename and merge nodes, so
+    names would no longer match the ONNX file.
+    """
+    tmp = tempfile.mkdtemp(prefix="xplain_prof_")
+    try:
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = INTRA_OP_THREADS
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+        so.enable_profiling = True
+        so.profile_file_prefix = os.path.join(tmp, "prof")
+        sess = ort.InferenceSession(model_path, so, providers=["CPUExecutionProvider"])
+        rng = np.random.default_rng(1)
+        # Symbolic / unknown dims -> 1, as in quantize_model.input_shapes
+        feeds = {i.name: rng.standard_normal([d if isinstance(d, int) and d > 0 else 1 for d in i.shape])
+                 .astype(np.float32) for i in sess.get_inputs()}
+        for _ in range(iters):
+            sess.run(None, feeds)
+        with open(sess.end_profiling(), "r", encoding="utf-8") as f:
+            events = json.load(f)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    times = {}
+    for ev in events:
+        name = ev.get("name", "")
+        if ev.get("cat") == "Node" and name.endswith("_kernel_time"):
+            node = name[:-len("_kernel_time")]
+            times[node] = times.get(node, 0.0) + float(ev.get("dur", 0))
+    return {k: v / iters for k, v in times.items()}
+
+def benchmark_onnx(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5, session=None,
+                   input_shapes=None):
+    """
+    `input_shapes` ({input_name: shape}, see quantize_model.input_shapes) feeds every
+    model input; without it the first input gets `input_shape`.
+    """
     if model_path is None:
         model_path = MODEL_DEFAULT
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"ONNX model not found at {model_path}. Run export_model.py first.")
 
-    sess = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
-    x = np.random.randn(*input_shape).astype(np.float32)
-    feeds = {sess.get_inputs()[0].name: x}
+    # Reuse a caller-provided (warm) session when given
+    sess = session if session is not None else create_session(model_path)
+    shapes = input_shapes or {sess.get_inputs()[0].name: input_shape}
+    feeds = {n: np.random.randn(*s).astype(np.float32) for n, s in shapes.items()}
 
     for _ in range(warmup):
         sess.run(None, feeds)
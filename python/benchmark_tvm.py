@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
-import os, time, numpy as np, psutil, onnx
+import os, time, contextlib, numpy as np, psutil, onnx
 try:
     import tvm
-    from tvm import relay
+    from tvm import relay, autotvm
     from tvm.contrib import graph_executor
 except Exception:
     tvm=None
@@ -10,7 +10,31 @@ except Exception:
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
 
-def benchmark_tvm(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5):
+# AutoTVM records for TARGET; applied when building if present (tune with tvm.autotvm)
+TUNING_LOG = os.path.join(ROOT, "dumps", "tvm_tuning_cortexa75.log")
+TARGET = "llvm -mcpu=cortex-a75"
+
+def tuning_log():
+    return TUNING_LOG if os.path.exists(TUNING_LOG) else None
+
+def compile_tvm(model_path, input_shape=(1,3,224,224), input_shapes=None):
+    """
+    Returns (lib, input_name) so callers can keep the built module around.
+    `input_shapes` ({input_name: shape}) overrides `input_shape` for multi-input / non-image models.
+    """
+    onnx_model = onnx.load(model_path)
+    input_name = onnx_model.graph.input[0].name
+    shape_dict = dict(input_shapes) if input_shapes else {input_name: input_shape}
+    mod, params = relay.frontend.from_onnx(onnx_model, shape_dict)
+
+    log = tuning_log()
+    with (autotvm.apply_history_best(log) if log else contextlib.nullcontext()):
+        with tvm.transform.PassContext(opt_level=3):
+            lib = relay.build(mod, target=TARGET, params=params)
+    return lib, input_name
+
+def benchmark_tvm(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5, compiled=None,
+                  input_shapes=None):
     if tvm is None:
         return {"error":"TVM not installed"}
     if model_path is None:
@@ -18,18 +42,11 @@ def benchmark_tvm(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5
     if not os.path.exists(model_path):
         return {"error":f"ONNX model not found at {model_path}"}
 
-    onnx_model = onnx.load(model_path)
-    input_name = onnx_model.graph.input[0].name
-    shape_dict = {input_name: input_shape}
-    mod, params = relay.frontend.from_onnx(onnx_model, shape_dict)
-
-    target = "llvm -mcpu=cortex-a75"
-    with tvm.transform.PassContext(opt_level=3):
-        lib = relay.build(mod, target=target, params=params)
+    lib, input_name = compiled if compiled is not None else compile_tvm(model_path, input_shape, input_shapes)
     dev = tvm.cpu()
     m = graph_executor.GraphModule(lib["default"](dev))
-    x = np.random.randn(*input_shape).astype("float32")
-    m.set_input(input_name, tvm.nd.array(x))
+    for name, shape in (input_shapes or {input_name: input_shape}).items():
+        m.set_input(name, tvm.nd.array(np.random.randn(*shape).astype("float32")))
     for _ in range(warmup): m.run()
     times=[]; proc=psutil.Process(os.getpid()); start_mem=proc.memory_info().rss
     for _ in range(iters):
@@ -37,7 +54,8 @@ def benchmark_tvm(model_path=None, input_shape=(1,3,224,224), iters=30, warmup=5
     peak_mem=proc.memory_info().rss
     latency_ms=float(np.median(times)*1000); throughput=float(1.0/np.mean(times))
     memory_mb=float((peak_mem-start_mem)/(1024*1024)); energy_est=float(np.median(times)*8)
-    return {"latency_ms":latency_ms,"throughput":throughput,"memory_mb":memory_mb,"energy_est":energy_est}
+    return {"latency_ms":latency_ms,"throughput":throughput,"memory_mb":memory_mb,"energy_est":energy_est,
+            "tuned":tuning_log() is not None}
 
 if __name__ == "__main__":
     print(benchmark_tvm())
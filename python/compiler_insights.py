@@ -1,20 +1,332 @@
 #!/usr/bin/env python3
-def explain_results(results):
+"""
+Data-driven performance advisor.
+
+Rules are plain functions registered with @rule. Each gets an InsightContext
+(benchmark results, fusion groups, per-op profile, host features) and returns
+zero or more insights:
+
+    {"rule": <id>, "kind": "error" | "finding" | "caveat", "score": float, "message": str}
+
+Scores are % of end-to-end latency: for a finding, the estimated saving from acting
+on it (or the saving already observed, for an INT8 gain); for a caveat, the share of
+latency it concerns. explain_results() lists errors first, then findings, then
+caveats, each ranked by score. Extra rules can be plugged in from anywhere with
+@rule("my-id").
+
+    python compiler_insights.py --check     # replay recorded fixtures in insight_fixtures/
+"""
+import os, sys, json, glob
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "insight_fixtures")
+
+FUSION_ANCHORS = {"Conv", "MatMul", "Gemm"}
+FUSABLE_ACTIVATIONS = {"Relu", "Clip", "Sigmoid", "LeakyRelu", "Tanh", "HardSigmoid"}
+
+RULES = []
+
+def rule(rule_id):
+    def register(fn):
+        fn.rule_id = rule_id
+        RULES[:] = [r for r in RULES if r.rule_id != rule_id] + [fn]
+        return fn
+    return register
+
+KIND_ORDER = {"error": 0, "finding": 1, "caveat": 2}
+
+def _insight(rule_id, score, message, kind="finding"):
+    return {"rule": rule_id, "kind": kind, "score": float(score), "message": message}
+
+def _latency_saving(throughput_gain):
+    """% latency saved for a given % throughput gain, to keep scores on one scale."""
+    return (1.0 - 1.0 / (1.0 + throughput_gain / 100.0)) * 100.0
+
+class InsightContext:
+    """
+    results       run_all / run_ab results: {"FP32-ONNXRuntime": {...}, ...}
+    fusion_groups op-type lists of what the runtime executes as one kernel, e.g.
+                  [["Conv", "Relu"], ["Conv"], ["Relu"]] (see fusion_groups())
+    op_profile    {node: {"op_type", "us", "depthwise"}} (see profile_ops)
+    host          {"cpus", "physical_cores", "intra_op_threads", "warnings"}
+    """
+    def __init__(self, results, fusion_groups=None, op_profile=None, host=None):
+        self.results = results or {}
+        self.fusion_groups = fusion_groups or []
+        self.op_profile = op_profile or {}
+        self.host = host or {}
+
+    def ok(self, name):
+        r = self.results.get(name)
+        return r if r and "error" not in r else None
+
+    def backends(self):
+        """Backends that have both an FP32 and an INT8 result, e.g. ["ONNXRuntime", "TVM-Ryzen"]."""
+        return sorted(k[5:] for k in self.results if k.startswith("FP32-") and "INT8-" + k[5:] in self.results)
+
+    def profile_total_us(self):
+        return sum(p.get("us", 0.0) for p in self.op_profile.values())
+
+def _paired(entry):
+    # Paired A/B speedup attached by ab_benchmark.run_ab, if this run was interleaved
+    ci = entry.get("speedup_ci95")
+    if not ci:
+        return ""
+    sp = entry["speedup_vs_fp32"]
+    note = "" if ci[0] > 1.0 or ci[1] < 1.0 else "; not significant"
+    return f" Paired A/B speedup {sp:.2f}x (95% CI {ci[0]:.2f}–{ci[1]:.2f}x{note})."
+
+@rule("backend-error")
+def _backend_errors(ctx):
+    out = []
+    for name, r in sorted(ctx.results.items()):
+        if isinstance(r, dict) and "error" in r and r["error"] != "TVM not installed":
+            out.append(_insight("backend-error", 0, f"{name} failed: {r['error']}", kind="error"))
+    return out
+
+@rule("int8-speedup")
+def _int8_speedup(ctx):
+    out = []
+    for b in ctx.backends():
+        fp, q = ctx.ok("FP32-" + b), ctx.ok("INT8-" + b)
+        if not fp or not q or not fp.get("latency_ms") or not q.get("latency_ms"):
+            continue
+        a, c = fp["latency_ms"], q["latency_ms"]
+        gain = (a - c) / a * 100.0
+        if gain >= 0:
+            msg = f"{b}: INT8 reduced latency by ~{gain:.1f}% (FP32 {a:.1f}ms → INT8 {c:.1f}ms)."
+            saving = gain
+        else:
+            msg = (f"{b}: INT8 increased latency by {(c - a) / a * 100.0:.1f}% (FP32 {a:.1f}ms → INT8 {c:.1f}ms). "
+                   f"Try quantize_search.py to find which layers to keep in FP32.")
+            # Staying on FP32 saves this much of the INT8 latency
+            saving = (c - a) / c * 100.0
+        out.append(_insight("int8-speedup", saving, msg + _paired(q)))
+    return out
+
+@rule("best-backend")
+def _best_backend(ctx):
+    fp32 = {k[5:]: r["latency_ms"] for k, r in ctx.results.items()
+            if k.startswith("FP32-") and ctx.ok(k) and r.get("latency_ms")}
+    if len(fp32) < 2:
+        return []
+    best = min(fp32, key=fp32.get)
+    worst = max(fp32, key=fp32.get)
+    gain = (fp32[worst] - fp32[best]) / fp32[worst] * 100.0
+    return [_insight("best-backend", gain,
+                     f"{best} is the fastest FP32 backend ({fp32[best]:.1f}ms), {gain:.0f}% below {worst} "
+                     f"({fp32[worst]:.1f}ms).")]
+
+@rule("depthwise-memory-bound")
+def _depthwise(ctx):
+    total = ctx.profile_total_us()
+    if not total:
+        return []
+    dw = sum(p.get("us", 0.0) for p in ctx.op_profile.values() if p.get("depthwise"))
+    share = dw / total * 100.0
+    if share < 30.0:
+        return []
+    # INT8 barely speeds up this share, which bounds the overall INT8 gain
+    return [_insight("depthwise-memory-bound", share,
+                     f"{share:.0f}% of time is in depthwise Conv, which is memory-bound; INT8 gains limited "
+                     f"(fewer bytes per activation help, but there is little arithmetic to speed up).",
+                     kind="caveat")]
+
+@rule("hot-op")
+def _hot_op(ctx):
+    total = ctx.profile_total_us()
+    if not total:
+        return []
+    by_op = {}
+    for p in ctx.op_profile.values():
+        by_op[p.get("op_type", "?")] = by_op.get(p.get("op_type", "?"), 0.0) + p.get("us", 0.0)
+    op = max(by_op, key=by_op.get)
+    share = by_op[op] / total * 100.0
+    if share < 50.0:
+        return []
+    return [_insight("hot-op", share, f"{share:.0f}% of profiled time is in {op}; optimize or quantize it first.",
+                     kind="caveat")]
+
+def amdahl_gain(parallel_fraction, threads_now, threads_new):
+    """Throughput gain (%) from threads_now -> threads_new under Amdahl's law."""
+    p = parallel_fraction
+    t_now = (1 - p) + p / threads_now
+    t_new = (1 - p) + p / threads_new
+    return (t_now / t_new - 1.0) * 100.0
+
+@rule("intra-op-threads")
+def _threads(ctx):
+    cores = ctx.host.get("physical_cores") or ctx.host.get("cpus")
+    now = ctx.host.get("intra_op_threads")
+    if not cores or not now or now >= cores:
+        return []
+    # Parallel fraction: share of profiled time in heavy (multi-threaded) kernels.
+    # Depthwise Conv is memory-bound and does not scale with threads, so it does not count.
+    total = ctx.profile_total_us()
+    heavy = {"Conv", "MatMul", "Gemm", "QLinearConv", "QLinearMatMul", "ConvInteger", "MatMulInteger"}
+    p = (sum(v.get("us", 0.0) for v in ctx.op_profile.values()
+             if v.get("op_type") in heavy and not v.get("depthwise")) / total) if total else 0.9
+    gain = amdahl_gain(p, now, cores)
+    if gain < 5.0:
+        return []
+    return [_insight("intra-op-threads", _latency_saving(gain),
+                     f"Raise intra-op threads to {cores}: +{gain:.0f}% throughput "
+                     f"(Amdahl estimate, {p * 100:.0f}% of time parallelizable, now {now} threads).")]
+
+@rule("tvm-untuned")
+def _tvm_untuned(ctx):
+    # benchmark_tvm* report whether an AutoTVM log was applied; results without the field say nothing
+    untuned = sorted(k for k in ctx.results if "TVM" in k and ctx.ok(k) and ctx.results[k].get("tuned") is False)
+    if not untuned:
+        return []
+    return [_insight("tvm-untuned", 0,
+                     f"TVM untuned: {', '.join(untuned)} were built with default schedules (no AutoTVM log); "
+                     f"these numbers understate TVM.", kind="caveat")]
+
+@rule("fusion-coverage")
+def _fusion(ctx):
+    # An anchor kernel whose activation still runs as a separate kernel right after it
+    groups = ctx.fusion_groups
+    fused = sum(1 for g in groups if len(g) > 1 and g[0] in FUSION_ANCHORS)
+    missed = sum(1 for g, nxt in zip(groups, groups[1:])
+                 if g == [g[0]] and g[0] in FUSION_ANCHORS and nxt == [nxt[0]] and nxt[0] in FUSABLE_ACTIVATIONS)
+    if not missed:
+        return []
+    cov = fused / (fused + missed) * 100.0
+    if cov >= 90.0:
+        return []
+    # Saving: the missed activations' kernel time, at the mean profiled activation cost
+    total = ctx.profile_total_us()
+    acts = [p.get("us", 0.0) for p in ctx.op_profile.values() if p.get("op_type") in FUSABLE_ACTIVATIONS]
+    saving = missed * (sum(acts) / len(acts)) / total * 100.0 if total and acts else 0.0
+    return [_insight("fusion-coverage", min(saving, 100.0),
+                     f"Only {fused} of {fused + missed} Conv/MatMul ops followed by an activation are fused with "
+                     f"it ({cov:.0f}%); unfused activations cost an extra round trip through memory each"
+                     + (f" (~{saving:.1f}% of profiled time)." if saving else "."))]
+
+@rule("noisy-host")
+def _noisy(ctx):
+    return [_insight("noisy-host", 0, f"Measurement caveat: {w}.", kind="caveat")
+            for w in ctx.host.get("warnings", [])]
+
+def advise(results, fusion_groups=None, op_profile=None, host=None):
+    """Runs every registered rule; returns errors, then findings, then caveats, each by score."""
+    ctx = InsightContext(results, fusion_groups, op_profile, host)
     insights = []
-    # ONNX FP32 vs INT8
-    if "FP32-ONNXRuntime" in results and "INT8-ONNXRuntime" in results:
-        a = results["FP32-ONNXRuntime"].get("latency_ms", None)
-        b = results["INT8-ONNXRuntime"].get("latency_ms", None)
-        if a and b:
-            gain = (a - b) / a * 100.0
-            insights.append(f"ONNXRuntime: INT8 reduced latency by ~{gain:.1f}% (FP32 {a:.1f}ms → INT8 {b:.1f}ms).")
-    # TVM examples
-    if "FP32-TVM-Ryzen" in results and "INT8-TVM-Ryzen" in results:
-        a = results["FP32-TVM-Ryzen"].get("throughput", None)
-        b = results["INT8-TVM-Ryzen"].get("throughput", None)
-        if a and b:
-            boost = (b - a) / a * 100.0
-            insights.append(f"TVM Ryzen: INT8 increased throughput by ~{boost:.1f}% (vectorized kernels / fuse).")
+    for r in RULES:
+        try:
+            insights.extend(r(ctx))
+        except Exception as e:
+            print(f"[compiler_insights] rule {r.rule_id} failed: {e}")
+    insights.sort(key=lambda i: (KIND_ORDER.get(i.get("kind"), 1), -i["score"]))
+    return insights
+
+def explain_results(results, **features):
+    insights = [i["message"] for i in advise(results, **features)]
     if not insights:
         insights.append("No detailed insights available. Try running both FP32 and INT8 or enable TVM.")
     return insights
+
+def profile_ops(model_path):
+    """
+    Per-node ORT profile joined with op metadata, in the `op_profile` format.
+    A Conv is depthwise when group > 1 and every group has a single input channel.
+    """
+    import onnx
+    from benchmark_onnx import profile_node_times
+    model = onnx.load(model_path, load_external_data=False)
+    weights = {i.name: list(i.dims) for i in model.graph.initializer}
+    times = profile_node_times(model_path)
+    prof = {}
+    for i, node in enumerate(model.graph.node):
+        name = node.name or f"{node.op_type}_{i}"
+        if name not in times:
+            continue
+        group = next((a.i for a in node.attribute if a.name == "group"), 1)
+        w = weights.get(node.input[1]) if node.op_type == "Conv" and len(node.input) > 1 else None
+        prof[name] = {"op_type": node.op_type, "us": times[name],
+                      "depthwise": bool(group > 1 and w is not None and len(w) > 1 and w[1] == 1)}
+    return prof
+
+def fusion_groups(model_path):
+    """
+    Kernels of the ORT-optimized graph (ORT_ENABLE_EXTENDED, CPU), in the
+    `fusion_groups` format. FusedConv / FusedGemm expand to their base op plus the
+    fused activation; an anchor whose only consumer is an unfused activation is
+    immediately followed by that activation's group.
+    """
+    import tempfile
+    import onnx
+    import onnxruntime as ort
+    with tempfile.TemporaryDirectory() as tmp:
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        so.optimized_model_filepath = os.path.join(tmp, "optimized.onnx")
+        ort.InferenceSession(model_path, so, providers=["CPUExecutionProvider"])
+        nodes = list(onnx.load(so.optimized_model_filepath, load_external_data=False).graph.node)
+
+    consumers = {}
+    for i, node in enumerate(nodes):
+        for t in node.input:
+            consumers.setdefault(t, []).append(i)
+    groups, emitted = [], set()
+    for i, node in enumerate(nodes):
+        if i in emitted or node.op_type == "Constant":
+            continue
+        if node.op_type in ("FusedConv", "FusedGemm"):
+            act = next((a.s.decode() for a in node.attribute if a.name == "activation"), None)
+            # FusedConv's optional 4th input is a residual Add
+            extra = ["Add"] if node.op_type == "FusedConv" and len(node.input) > 3 and node.input[3] else []
+            groups.append([node.op_type[5:]] + extra + ([act] if act else []))
+            continue
+        groups.append([node.op_type])
+        users = consumers.get(node.output[0], []) if node.output else []
+        if node.op_type in FUSION_ANCHORS and len(users) == 1 and nodes[users[0]].op_type in FUSABLE_ACTIVATIONS:
+            groups.append([nodes[users[0]].op_type])
+            emitted.add(users[0])
+    return groups
+
+def host_features(intra_op_threads=None):
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False)
+    except Exception:
+        physical = None
+    return {"cpus": os.cpu_count(), "physical_cores": physical,
+            "intra_op_threads": intra_op_threads}
+
+def check_fixtures(pattern=os.path.join(FIXTURES, "*.json")):
+    """
+    Replays recorded inputs and checks which rules fire:
+    {"inputs": {...advise kwargs...}, "expect_rules": [...], "expect_absent": [...], "expect_top": id}
+    Returns the list of failure messages.
+    """
+    failures = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            fx = json.load(f)
+        got = advise(**fx["inputs"])
+        fired = {i["rule"] for i in got}
+        name = os.path.basename(path)
+        for r in fx.get("expect_rules", []):
+            if r not in fired:
+                failures.append(f"{name}: expected rule {r} to fire")
+        for r in fx.get("expect_absent", []):
+            if r in fired:
+                failures.append(f"{name}: rule {r} should not fire")
+        if "expect_top" in fx and (not got or got[0]["rule"] != fx["expect_top"]):
+            failures.append(f"{name}: expected top rule {fx['expect_top']}, got {got[0]['rule'] if got else None}")
+    return failures
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--check":
+        fails = check_fixtures()
+        for f in fails:
+            print(f"[compiler_insights] FAIL {f}")
+        print(f"[compiler_insights] {'OK' if not fails else f'{len(fails)} failures'}")
+        sys.exit(1 if fails else 0)
+    if len(sys.argv) != 2:
+        print("Usage: python compiler_insights.py <results.json> | --check")
+        sys.exit(1)
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        for line in explain_results(json.load(f)):
+            print("-", line)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Tensor liveness / peak activation memory planner for ONNX graphs.
+
+Tensor shapes come from ONNX shape inference, op categories from
+graph_visualizer.canonicalize. Lifetimes are computed under a topological
+execution order: a tensor is live from the step that produces it to the step
+of its last consumer (graph outputs stay live to the end). Everything is a
+constant number of passes over nodes + edges, so it scales to 100k-node graphs.
+"""
+import os, sys, json
+from collections import deque
+import numpy as np
+import onnx
+from onnx import shape_inference, helper
+
+from graph_visualizer import canonicalize
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
+
+# Output may overwrite its (dying) first input buffer
+INPLACE_OPS = {"Relu", "LeakyRelu", "Sigmoid", "Tanh", "Clip", "HardSigmoid", "HardSwish",
+               "Add", "Sub", "Mul", "Div", "BatchNormalization", "Identity", "Dropout",
+               "Reshape", "Flatten", "Squeeze", "Unsqueeze"}
+# Epilogues a backend typically fuses into the preceding Conv/MatMul/Gemm
+FUSABLE_EPILOGUES = {"Relu", "LeakyRelu", "Sigmoid", "Clip", "HardSwish", "BatchNormalization", "Add", "Mul"}
+FUSION_ANCHORS = {"Conv", "MatMul", "Gemm", "ConvTranspose"}
+
+def _elem_size(elem_type):
+    try:
+        return np.dtype(helper.tensor_dtype_to_np_dtype(elem_type)).itemsize
+    except Exception:
+        return 0
+
+def _tensor_bytes(value_info, batch):
+    t = value_info.type.tensor_type
+    if not t.HasField("shape"):
+        return None
+    n = 1
+    for d in t.shape.dim:
+        if d.HasField("dim_value") and d.dim_value > 0:
+            n *= d.dim_value
+        elif d.HasField("dim_param"):
+            n *= batch
+        else:
+            return None
+    return n * _elem_size(t.elem_type)
+
+def _topo_order(nodes, produced_by):
+    """Kahn's algorithm, stable w.r.t. file order; O(nodes + edges)."""
+    indeg = [0] * len(nodes)
+    users = [[] for _ in nodes]
+    for i, node in enumerate(nodes):
+        for src in {produced_by[t] for t in node.input if t in produced_by}:
+            if src != i:
+                indeg[i] += 1
+                users[src].append(i)
+    ready = deque(i for i in range(len(nodes)) if indeg[i] == 0)
+    order = []
+    while ready:
+        i = ready.popleft()
+        order.append(i)
+        for j in users[i]:
+            indeg[j] -= 1
+            if indeg[j] == 0:
+                ready.append(j)
+    if len(order) != len(nodes):
+        raise ValueError("graph has a cycle; cannot derive an execution order")
+    return order
+
+def _peak(tensors, num_steps):
+    """
+    tensors: iterable of (birth, death, nbytes). Returns (peak_bytes, peak_step, timeline).
+    Difference array over steps -> O(tensors + steps).
+    """
+    delta = [0] * (num_steps + 2)
+    for birth, death, nbytes in tensors:
+        if nbytes:
+            delta[birth + 1] += nbytes
+            delta[death + 2] -= nbytes
+    # index 0 = "before the first node" (graph inputs only)
+    timeline, live = [], 0
+    for s in range(num_steps + 1):
+        live += delta[s]
+        timeline.append(live)
+    peak_step = max(range(len(timeline)), key=timeline.__getitem__) if timeline else 0
+    return (timeline[peak_step] if timeline else 0), peak_step - 1, timeline
+
+def plan_memory(model_path=MODEL_DEFAULT, batch=1, top_k=20):
+    """
+    Returns a JSON-serializable report:
+      peak_bytes / peak_step / peak_node   planned peak of live activation bytes
+      live_at_peak                         largest tensors live at the peak (+ producer node)
+      estimates                            peak with in-place reuse, with fusion, and both
+      timeline                             live bytes before step 0 and after every step
+    Initializers and Constant outputs are weights, not activations, and are excluded.
+    """
+    model = onnx.load(model_path, load_external_data=False)
+    try:
+        model = shape_inference.infer_shapes(model)
+    except Exception as e:
+        print(f"[memory_planner] WARNING: shape inference failed ({e}); using declared shapes only")
+    g = model.graph
+
+    weights = {i.name for i in g.initializer}
+    nodes = list(g.node)
+    produced_by = {}
+    for i, node in enumerate(nodes):
+        if node.op_type == "Constant":
+            weights.update(node.output)
+            continue
+        for t in node.output:
+            if t:
+                produced_by[t] = i
+
+    order = _topo_order(nodes, produced_by)
+    step_of = [0] * len(nodes)
+    for s, i in enumerate(order):
+        step_of[i] = s
+    n_steps = len(order)
+
+    sizes = {}
+    for vi in list(g.input) + list(g.value_info) + list(g.output):
+        if vi.name not in weights:
+            sizes[vi.name] = _tensor_bytes(vi, batch)
+
+    # Lifetimes: birth = producing step (-1 for graph inputs), death = last use
+    birth, death = {}, {}
+    for vi in g.input:
+        if vi.name not in weights:
+            birth[vi.name] = death[vi.name] = -1
+    for i, node in enumerate(nodes):
+        if node.op_type == "Constant":
+            continue
+        s = step_of[i]
+        for t in node.output:
+            if t:
+                birth[t] = death[t] = s
+    consumers = {}
+    for i, node in enumerate(nodes):
+        s = step_of[i]
+        for t in node.input:
+            if t in birth:
+                death[t] = max(death[t], s)
+                consumers.setdefault(t, []).append(i)
+    for vi in g.output:
+        if vi.name in birth:
+            death[vi.name] = n_steps - 1
+
+    unknown = [t for t in birth if sizes.get(t) is None]
+    nbytes = {t: sizes.get(t) or 0 for t in birth}
+
+    base = [(birth[t], death[t], nbytes[t]) for t in birth]
+    peak, peak_step, timeline = _peak(base, n_steps)
+
+    live = [t for t in birth if birth[t] <= peak_step <= death[t] and nbytes[t]]
+    live.sort(key=lambda t: nbytes[t], reverse=True)
+    live_at_peak = [{
+        "tensor": t,
+        "bytes": nbytes[t],
+        "producer": (nodes[produced_by[t]].name or f"{nodes[produced_by[t]].op_type}_{produced_by[t]}")
+                    if t in produced_by else "<graph input>",
+        "op": canonicalize(nodes[produced_by[t]].op_type) if t in produced_by else "Input",
+    } for t in live[:top_k]]
+    peak_node = nodes[order[peak_step]] if 0 <= peak_step < n_steps else None
+
+    graph_outputs = {vi.name for vi in g.output}
+
+    def merged_peak(can_merge):
+        # Output t of a qualifying node shares the buffer of input `src`; the shared
+        # buffer lives from src's birth to t's death. Walk in execution order so
+        # chains (Conv -> BN -> Relu) collapse onto one root buffer.
+        root, b, d, sz = {}, dict(birth), dict(death), dict(nbytes)
+        for i in order:
+            node = nodes[i]
+            src = can_merge(i)
+            if src is None or not node.output or node.output[0] not in b:
+                continue
+            out = node.output[0]
+            r = root.get(src, src)
+            if sz[out] > sz[r]:
+                continue
+            root[out] = r
+            d[r] = max(d[r], d[out])
+            sz[out] = 0
+        return _peak(((b[t], d[t], sz[t]) for t in b), n_steps)[0]
+
+    def inplace_src(i):
+        node = nodes[i]
+        if node.op_type not in INPLACE_OPS or not node.input:
+            return None
+        src = node.input[0]
+        # Only if this node is the input's last reader and the input is not a graph output
+        if src in birth and src not in graph_outputs and death[src] == step_of[i]:
+            return src
+        return None
+
+    # Epilogue chains hanging off an anchor (Conv -> BN -> Relu): a tensor is "in a
+    # fusion chain" if an anchor produced it or a fused epilogue did
+    fused_into = {}
+    in_chain = set()
+    for i in order:
+        node = nodes[i]
+        if node.op_type in FUSION_ANCHORS:
+            in_chain.update(node.output[:1])
+        elif node.op_type in FUSABLE_EPILOGUES and node.input and node.output:
+            src = node.input[0]
+            if src in in_chain and src not in graph_outputs and len(consumers.get(src, ())) == 1:
+                fused_into[i] = src
+                in_chain.add(node.output[0])
+
+    def fusion_src(i):
+        return fused_into.get(i)
+
+    inplace_peak = merged_peak(inplace_src)
+    fusion_peak = merged_peak(fusion_src)
+    combined_peak = merged_peak(lambda i: fusion_src(i) or inplace_src(i))
+
+    return {
+        "model": model_path,
+        "batch": batch,
+        "num_nodes": n_steps,
+        "num_activation_tensors": len(birth),
+        "unknown_shape_tensors": len(unknown),
+        "peak_bytes": peak,
+        "peak_mb": peak / (1024.0 * 1024.0),
+        "peak_step": peak_step,
+        "peak_node": (peak_node.name or peak_node.op_type) if peak_node is not None else "<graph input>",
+        "live_at_peak": live_at_peak,
+        "estimates": {
+            "inplace_peak_bytes": inplace_peak,
+            "fusion_peak_bytes": fusion_peak,
+            "combined_peak_bytes": combined_peak,
+            "inplace_saving_pct": _pct(peak, inplace_peak),
+            "fusion_saving_pct": _pct(peak, fusion_peak),
+            "combined_saving_pct": _pct(peak, combined_peak),
+        },
+        "timeline": timeline,
+    }
+
+def _pct(before, after):
+    return (before - after) / before * 100.0 if before else 0.0
+
+def _measure_child(backend, model_path, input_shape, iters, conn):
+    # Runs in a fresh process so ru_maxrss reflects only this backend
+    import resource, psutil
+    try:
+        proc = psutil.Process(os.getpid())
+        before = proc.memory_info().rss
+        x = np.random.randn(*input_shape).astype(np.float32)
+        if backend == "ort":
+            from benchmark_onnx import create_session
+            sess = create_session(model_path)
+            feeds = {sess.get_inputs()[0].name: x}
+            run = lambda: sess.run(None, feeds)
+        else:
+            import benchmark_tvm_ryzen as bt
+            if bt.tvm is None:
+                conn.send({"error": "TVM not installed"})
+                return
+            from tvm.contrib import graph_executor
+            lib, input_name = bt.compile_tvm(model_path, input_shape)
+            m = graph_executor.GraphModule(lib["default"](bt.tvm.cpu()))
+            m.set_input(input_name, bt.tvm.nd.array(x))
+            run = m.run
+        loaded = proc.memory_info().rss
+        for _ in range(iters):
+            run()
+        after = proc.memory_info().rss
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+        conn.send({"load_mb": (loaded - before) / 1048576.0,
+                   "run_mb": (after - loaded) / 1048576.0,
+                   "peak_rss_mb": peak / 1048576.0})
+    except Exception as e:
+        conn.send({"error": str(e)})
+
+def measure_rss(model_path=MODEL_DEFAULT, input_shape=(1,3,224,224), iters=3):
+    """
+    RSS growth while loading the model and during inference, per backend, each
+    in its own process. `run_mb` is the number to hold against the planned peak.
+    """
+    import multiprocessing as mp
+    ctx = mp.get_context("spawn")
+    out = {}
+    for backend, key in (("ort", "ONNXRuntime"), ("tvm", "TVM")):
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=_measure_child, args=(backend, model_path, input_shape, iters, child))
+        p.start()
+        # Drop our copy of the child end so a crashed child shows up as EOF, not a 10 min wait
+        child.close()
+        try:
+            out[key] = parent.recv() if parent.poll(600) else {"error": "timed out"}
+        except EOFError:
+            out[key] = {"error": f"measurement process died (exit code {p.exitcode})"}
+        parent.close()
+        p.join(5)
+        if p.is_alive():
+            p.terminate()
+    return out
+
+def compare_with_measured(plan, measured):
+    planned_mb = plan["peak_mb"]
+    return {k: dict(v, planned_mb=planned_mb,
+                    ratio=(v["run_mb"] / planned_mb) if planned_mb and "run_mb" in v else None)
+            for k, v in measured.items()}
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else MODEL_DEFAULT
+    plan = plan_memory(path)
+    plan.pop("timeline")
+    if "--measure" in sys.argv:
+        plan["measured"] = compare_with_measured(plan, measure_rss(path))
+    print(json.dumps(plan, indent=2))
@@ -1,37 +1,83 @@
 #!/usr/bin/env python3
 import sys, os
+import numpy as np
 import onnx
-from onnxruntime.quantization import quantize_static, QuantType, CalibrationDataReader
+from onnxruntime.quantization import (quantize_static, quantize_dynamic, QuantType, QuantFormat,
+                                      CalibrationDataReader)
 
-class DummyDataReader(CalibrationDataReader):
-    def __init__(self, model_path):
-        # Minimal dummy input reader for calibration
-        self.model = onnx.load(model_path)
-        self.enum_data_dicts = None
+def input_shapes(model_path, batch=1):
+    """
+    Returns {input_name: shape} for the real graph inputs (initializers excluded).
+    Symbolic / unknown dims are replaced by `batch`.
+    """
+    model = onnx.load(model_path, load_external_data=False)
+    inits = {i.name for i in model.graph.initializer}
+    shapes = {}
+    for inp in model.graph.input:
+        if inp.name in inits:
+            continue
+        dims = inp.type.tensor_type.shape.dim
+        shapes[inp.name] = tuple(d.dim_value if d.dim_value > 0 else batch for d in dims)
+    return shapes
+
+class RandomDataReader(CalibrationDataReader):
+    """Feeds `num_samples` random float32 batches shaped like the model inputs."""
+    def __init__(self, model_path, num_samples=8, seed=0):
+        shapes = input_shapes(model_path)
+        rng = np.random.default_rng(seed)
+        self.samples = [{n: rng.standard_normal(s).astype(np.float32) for n, s in shapes.items()}
+                        for _ in range(num_samples)]
+        self.enum_data_dicts = iter(self.samples)
 
     def get_next(self):
-        return None
+        return next(self.enum_data_dicts, None)
+
+    def rewind(self):
+        self.enum_data_dicts = iter(self.samples)
 
-def quantize_model(fp32_model_path, int8_model_path):
+def quantize_model(fp32_model_path, int8_model_path, quant_format="QOperator", dynamic=False,
+                   op_types=("Conv", "MatMul"), nodes_to_exclude=None, per_channel=True,
+                   calibration_data_reader=None, verbose=True):
     if not os.path.exists(fp32_model_path):
         print(f"[quantize_model] ERROR: {fp32_model_path} not found")
         return
 
-    print(f"[quantize_model] Quantizing {fp32_model_path} -> {int8_model_path}")
-
-    # Use static quantization with QLinear ops
-    quantize_static(
-        model_input=fp32_model_path,
-        model_output=int8_model_path,
-        calibration_data_reader=DummyDataReader(fp32_model_path),
-        activation_type=QuantType.QInt8,
-        weight_type=QuantType.QInt8,
-        op_types_to_quantize=["Conv", "MatMul"],  # QLinearConv + QLinearMatMul
-        per_channel=True,
-        reduce_range=False
-    )
-
-    print(f"[quantize_model] Quantized model written to {int8_model_path}")
+    if verbose:
+        print(f"[quantize_model] Quantizing {fp32_model_path} -> {int8_model_path} "
+              f"({'dynamic' if dynamic else 'static'}, {quant_format})")
+
+    if dynamic:
+        # Weights quantized offline, activations quantized at runtime (no calibration)
+        quantize_dynamic(
+            model_input=fp32_model_path,
+            model_output=int8_model_path,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=list(op_types),
+            nodes_to_exclude=list(nodes_to_exclude or []),
+            per_channel=per_channel,
+            reduce_range=False
+        )
+    else:
+        if calibration_data_reader is None:
+            # quantize_static rejects a reader that yields no samples
+            calibration_data_reader = RandomDataReader(fp32_model_path)
+        # Static quantization: QOperator -> QLinear ops, QDQ -> Quantize/DequantizeLinear pairs
+        quantize_static(
+            model_input=fp32_model_path,
+            model_output=int8_model_path,
+            calibration_data_reader=calibration_data_reader,
+            quant_format=QuantFormat.QDQ if quant_format == "QDQ" else QuantFormat.QOperator,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=list(op_types),  # QLinearConv + QLinearMatMul by default
+            nodes_to_exclude=list(nodes_to_exclude or []),
+            per_channel=per_channel,
+            reduce_range=False
+        )
+
+    if verbose:
+        print(f"[quantize_model] Quantized model written to {int8_model_path}")
+    return int8_model_path
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
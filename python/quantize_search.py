@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import os, sys, json, time, shutil, tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import onnx
+
+try:
+    import onnxruntime as ort
+except Exception as e:
+    raise RuntimeError("onnxruntime is required. Install with `pip install onnxruntime`.") from e
+
+from quantize_model import quantize_model, input_shapes, RandomDataReader
+from benchmark_onnx import profile_node_times
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
+
+# Op types the search is allowed to quantize
+SEARCH_OP_TYPES = ("Conv", "MatMul", "Gemm", "Add", "Mul")
+
+# (mode, format) pairs tried for the final mixed-precision candidates.
+# Dynamic quantization has no QDQ/QOperator choice and only covers weight-bearing ops.
+SEARCH_CONFIGS = [
+    {"mode": "static", "format": "QOperator"},
+    {"mode": "static", "format": "QDQ"},
+    {"mode": "dynamic", "format": "QOperator"},
+]
+DYNAMIC_OP_TYPES = ("Conv", "MatMul", "Gemm")
+
+NUM_CALIB = 8
+NUM_EVAL = 4
+
+def _session(model_path):
+    return ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+
+def _eval_feeds(model_path, seed=1):
+    shapes = input_shapes(model_path)
+    rng = np.random.default_rng(seed)
+    return [{n: rng.standard_normal(s).astype(np.float32) for n, s in shapes.items()}
+            for _ in range(NUM_EVAL)]
+
+def output_error(ref_outputs, model_path, feeds):
+    """
+    Mean over samples of the worst relative L2 error across model outputs
+    (||y_fp32 - y_q|| / ||y_fp32||).
+    """
+    sess = _session(model_path)
+    errs = []
+    for ref, feed in zip(ref_outputs, feeds):
+        out = sess.run(None, feed)
+        worst = 0.0
+        for r, q in zip(ref, out):
+            denom = float(np.linalg.norm(r)) or 1.0
+            worst = max(worst, float(np.linalg.norm(r - q.astype(r.dtype))) / denom)
+        errs.append(worst)
+    return float(np.mean(errs))
+
+def _quantizable_nodes(model_path, op_types):
+    model = onnx.load(model_path, load_external_data=False)
+    return [n.name for n in model.graph.node if n.op_type in op_types and n.name]
+
+def _latency_ms(model_path, iters=20, warmup=3):
+    sess = _session(model_path)
+    feeds = _eval_feeds(model_path)[0]
+    for _ in range(warmup):
+        sess.run(None, feeds)
+    times = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        sess.run(None, feeds)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times) * 1000.0)
+
+def _evaluate(job):
+    """
+    Worker entry point: quantize one candidate and measure its output error.
+    Runs in a separate process, so it only takes / returns plain data.
+    With cfg["discard"] the quantized model is deleted once scored.
+    """
+    fp32_path, out_path, cfg, ref_outputs, feeds = job
+    ops = cfg["op_types"]
+    if cfg["mode"] == "dynamic":
+        ops = [o for o in ops if o in DYNAMIC_OP_TYPES]
+    # ORT writes "<stem>-inferred.onnx" next to its input and deletes it afterwards,
+    # so every job quantizes its own copy in a private directory
+    job_dir = os.path.splitext(out_path)[0] + "_job"
+    try:
+        os.makedirs(job_dir, exist_ok=True)
+        src = os.path.join(job_dir, os.path.basename(fp32_path))
+        shutil.copyfile(fp32_path, src)
+        try:
+            quantize_model(src, out_path,
+                           quant_format=cfg["format"],
+                           dynamic=cfg["mode"] == "dynamic",
+                           op_types=ops,
+                           nodes_to_exclude=cfg["exclude"],
+                           calibration_data_reader=None if cfg["mode"] == "dynamic"
+                           else RandomDataReader(src, NUM_CALIB),
+                           verbose=False)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        return dict(cfg, path=out_path, error=output_error(ref_outputs, out_path, feeds))
+    except Exception as e:
+        return dict(cfg, path=out_path, error=None, failed=str(e))
+    finally:
+        if cfg.get("discard") and os.path.exists(out_path):
+            os.remove(out_path)
+
+def _run_jobs(jobs, workers):
+    if workers <= 1:
+        return [_evaluate(j) for j in jobs]
+    # spawn, not fork: the caller may be bench_worker, which holds runtime thread pools
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        return list(pool.map(_evaluate, jobs))
+
+def layer_sensitivity(fp32_model_path, work_dir, ref_outputs, feeds, op_types=SEARCH_OP_TYPES, workers=None):
+    """
+    Quantizes each candidate node on its own (static QDQ, everything else FP32).
+    Returns ({node_name: output_error}, {node_name: failure message}).
+    """
+    nodes = _quantizable_nodes(fp32_model_path, op_types)
+    jobs = []
+    for i, name in enumerate(nodes):
+        cfg = {"mode": "static", "format": "QDQ", "op_types": list(op_types),
+               "exclude": [n for n in nodes if n != name], "layer": name, "discard": True}
+        jobs.append((fp32_model_path, os.path.join(work_dir, f"sens_{i}.onnx"), cfg, ref_outputs, feeds))
+    results = _run_jobs(jobs, workers or os.cpu_count() or 1)
+    sensitivity = {r["layer"]: r["error"] for r in results if r["error"] is not None}
+    failed = {r["layer"]: r.get("failed", "") for r in results if r["error"] is None}
+    for name, msg in failed.items():
+        print(f"[quantize_search] WARNING: sensitivity of {name} not measured: {msg}")
+    return sensitivity, failed
+
+def layer_speed_gain(fp32_model_path, int8_model_path):
+    """
+    Per-node kernel time saved by quantization (FP32 us - INT8 us), from ORT profiles
+    (basic optimization level, so FP32 node names survive).
+    Quantized kernels are matched back to their FP32 node by name prefix
+    (QLinearConv "conv1_quant" -> "conv1").
+    """
+    fp32_t = profile_node_times(fp32_model_path)
+    int8_t = profile_node_times(int8_model_path)
+    gains = {}
+    for node, t in fp32_t.items():
+        q = sum(v for k, v in int8_t.items() if k == node or k.startswith(node + "_"))
+        gains[node] = t - q if q else 0.0
+    return gains
+
+def _exclusion_ranking(sensitivity, gains):
+    # Worst first: high error per microsecond saved -> leave in FP32
+    def cost(n):
+        return sensitivity[n] / max(gains.get(n, 0.0), 1e-3)
+    return sorted(sensitivity, key=cost, reverse=True)
+
+def _prefix_sizes(n):
+    # Excluding all n nodes is just the FP32 model, so stop at n - 1
+    sizes, k = [0], 1
+    while k < n:
+        sizes.append(k)
+        k *= 2
+    if n > 1:
+        sizes.append(n - 1)
+    return sorted(set(sizes))
+
+def search_quantization(fp32_model_path=MODEL_DEFAULT, output_path=None, error_budget=0.02,
+                        op_types=SEARCH_OP_TYPES, workers=None):
+    """
+    Mixed-precision quantization search.
+
+    1. Per-layer sensitivity: output error with only that node quantized.
+    2. Per-layer speed gain: profiled kernel time FP32 vs. fully quantized.
+    3. Nodes are ranked by error-per-microsecond-saved; for each config in SEARCH_CONFIGS
+       the top-k nodes (k = 0, 1, 2, 4, ..., n-1) are left in FP32.
+    4. All candidates are quantized and scored in parallel worker processes; those within
+       `error_budget` are timed one after another and the fastest is copied to `output_path`.
+
+    Returns a report dict (JSON-serializable).
+    """
+    if not os.path.exists(fp32_model_path):
+        return {"error": f"ONNX model not found at {fp32_model_path}"}
+    if output_path is None:
+        output_path = os.path.splitext(fp32_model_path)[0] + "_mixed.onnx"
+    workers = workers or os.cpu_count() or 1
+
+    work_dir = tempfile.mkdtemp(prefix="xplain_qsearch_")
+    try:
+        feeds = _eval_feeds(fp32_model_path)
+        ref_sess = _session(fp32_model_path)
+        ref_outputs = [ref_sess.run(None, f) for f in feeds]
+        fp32_latency = _latency_ms(fp32_model_path)
+
+        print(f"[quantize_search] Measuring per-layer sensitivity of {fp32_model_path}")
+        sensitivity, sens_failed = layer_sensitivity(fp32_model_path, work_dir, ref_outputs, feeds,
+                                                     op_types, workers)
+        # Unmeasured nodes stay FP32 in every candidate rather than being guessed at
+        always_fp32 = sorted(sens_failed)
+
+        full_int8 = _evaluate((fp32_model_path, os.path.join(work_dir, "full.onnx"),
+                               {"mode": "static", "format": "QOperator", "op_types": list(op_types),
+                                "exclude": []}, ref_outputs, feeds))
+        gains = layer_speed_gain(fp32_model_path, full_int8["path"]) if "failed" not in full_int8 else {}
+        ranking = _exclusion_ranking(sensitivity, gains)
+
+        jobs = []
+        for cfg in SEARCH_CONFIGS:
+            for k in _prefix_sizes(len(ranking)):
+                c = dict(cfg, op_types=list(op_types), exclude=always_fp32 + ranking[:k])
+                jobs.append((fp32_model_path, os.path.join(work_dir, f"cand_{len(jobs)}.onnx"),
+                             c, ref_outputs, feeds))
+        print(f"[quantize_search] Evaluating {len(jobs)} candidates on {workers} workers")
+        candidates = _run_jobs(jobs, workers)
+
+        # Timing is done serially so parallel workers do not skew each other's latency
+        for c in candidates:
+            if c.get("error") is not None and c["error"] <= error_budget:
+                c["latency_ms"] = _latency_ms(c["path"])
+        passing = [c for c in candidates if "latency_ms" in c]
+        best = min(passing, key=lambda c: c["latency_ms"]) if passing else None
+
+        if best is not None and best["latency_ms"] < fp32_latency:
+            shutil.copyfile(best["path"], output_path)
+            print(f"[quantize_search] Best: {best['mode']}/{best['format']}, {len(best['exclude'])} "
+                  f"nodes kept FP32, {best['latency_ms']:.2f}ms (FP32 {fp32_latency:.2f}ms), "
+                  f"error {best['error']:.4f} -> {output_path}")
+        else:
+            shutil.copyfile(fp32_model_path, output_path)
+            best = None
+            print(f"[quantize_search] No candidate beat FP32 within budget {error_budget}; kept FP32 model")
+
+        strip = lambda c: {k: v for k, v in c.items() if k != "path"}
+        return {
+            "model": fp32_model_path,
+            "output": output_path,
+            "error_budget": error_budget,
+            "fp32_latency_ms": fp32_latency,
+            "sensitivity": sensitivity,
+            "sensitivity_failed": sens_failed,
+            "speed_gain_us": gains,
+            "best": strip(best) if best else None,
+            "candidates": [strip(c) for c in candidates],
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python quantize_search.py <fp32_model.onnx> [output.onnx] [error_budget]")
+        sys.exit(1)
+    fp32 = sys.argv[1]
+    out = sys.argv[2] if len(sys.argv) > 2 else None
+    budget = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+    print(json.dumps(search_quantization(fp32, out, budget), indent=2))
@@ -4,6 +4,8 @@ from benchmark_onnx import benchmark_onnx
 
 # Try TVM imports
 try:
+    import benchmark_tvm as _tvm_a75
+    import benchmark_tvm_ryzen as _tvm_ryzen
     from benchmark_tvm import benchmark_tvm
     from benchmark_tvm_ryzen import benchmark_tvm_ryzen
     TVM_AVAILABLE = True
@@ -14,35 +16,53 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 MODEL_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2.onnx")
 MODEL_INT8_DEFAULT = os.path.join(ROOT, "models", "mobilenetv2_int8.onnx")
 
-def run_all(fp32_model=MODEL_DEFAULT, int8_model=MODEL_INT8_DEFAULT):
+def run_all(fp32_model=MODEL_DEFAULT, int8_model=MODEL_INT8_DEFAULT, cache=None, input_shapes=None):
+    """
+    `cache` (optional, see bench_worker.SessionCache) supplies warm ORT sessions
+    and built TVM modules instead of creating them per call. `input_shapes`
+    ({input_name: shape}) feeds every model input; the default is one 1x3x224x224 image.
+    """
+    def onnx_kw(path):
+        kw = {"input_shapes": input_shapes}
+        if cache is not None:
+            kw["session"] = cache.ort_session(path)
+        return kw
+
+    def tvm_kw(path, backend):
+        kw = {"input_shapes": input_shapes}
+        # Leave the "TVM not installed" handling to the benchmark itself
+        if cache is not None and backend.tvm is not None:
+            kw["compiled"] = cache.tvm_module(path, backend, input_shapes=input_shapes)
+        return kw
+
     results = {}
     # FP32
     try:
-        results["FP32-ONNXRuntime"] = benchmark_onnx(fp32_model)
+        results["FP32-ONNXRuntime"] = benchmark_onnx(fp32_model, **onnx_kw(fp32_model))
     except Exception as e:
         results["FP32-ONNXRuntime"] = {"error": str(e)}
     if TVM_AVAILABLE:
         try:
-            results["FP32-TVM-CortexA75"] = benchmark_tvm(fp32_model)
+            results["FP32-TVM-CortexA75"] = benchmark_tvm(fp32_model, **tvm_kw(fp32_model, _tvm_a75))
         except Exception as e:
             results["FP32-TVM-CortexA75"] = {"error": str(e)}
         try:
-            results["FP32-TVM-Ryzen"] = benchmark_tvm_ryzen(fp32_model)
+            results["FP32-TVM-Ryzen"] = benchmark_tvm_ryzen(fp32_model, **tvm_kw(fp32_model, _tvm_ryzen))
         except Exception as e:
             results["FP32-TVM-Ryzen"] = {"error": str(e)}
     # INT8 (only if file exists)
-    if os.path.exists(int8_model):
+    if int8_model and os.path.exists(int8_model):
         try:
-            results["INT8-ONNXRuntime"] = benchmark_onnx(int8_model)
+            results["INT8-ONNXRuntime"] = benchmark_onnx(int8_model, **onnx_kw(int8_model))
         except Exception as e:
             results["INT8-ONNXRuntime"] = {"error": str(e)}
         if TVM_AVAILABLE:
             try:
-                results["INT8-TVM-CortexA75"] = benchmark_tvm(int8_model)
+                results["INT8-TVM-CortexA75"] = benchmark_tvm(int8_model, **tvm_kw(int8_model, _tvm_a75))
             except Exception as e:
                 results["INT8-TVM-CortexA75"] = {"error": str(e)}
             try:
-                results["INT8-TVM-Ryzen"] = benchmark_tvm_ryzen(int8_model)
+                results["INT8-TVM-Ryzen"] = benchmark_tvm_ryzen(int8_model, **tvm_kw(int8_model, _tvm_ryzen))
             except Exception as e:
                 results["INT8-TVM-Ryzen"] = {"error": str(e)}
     return results